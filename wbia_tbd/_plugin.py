@@ -9,16 +9,31 @@ import vtool as vt
 import wbia
 from wbia import dtool as dt
 import os
+import math
+import functools
+import threading
+import contextlib
 import torch
+from dataclasses import replace
 import torchvision.transforms as transforms  # noqa: E402
-from scipy.spatial import distance_matrix
 
 import tqdm
 
 from wbia_tbd.helpers import get_config, read_json
 from wbia_tbd.models import get_model
-from wbia_tbd.datasets import PluginDataset, get_test_transforms
-from wbia_tbd.metrics import pred_light, compute_distance_matrix, eval_onevsall
+from wbia_tbd.datasets import (
+    PluginDataset,
+    CudaPrefetcher,
+    NormalizeBatch,
+    get_test_resize_transforms,
+)
+from wbia_tbd.metrics import (
+    pred_light,
+    pred_light_distmat,
+    normalized_cosine_distance,
+    blocked_normalized_cosine_distance,
+    eval_onevsall,
+)
 
 (print, rrr, profile) = ut.inject2(__name__)
 
@@ -65,13 +80,17 @@ MODELS = {
 }
 
 
-GLOBAL_EMBEDDING_CACHE = {}
+# Cached embeddings are stored as float16 rows of a single matrix, indexed by aid.
+# The matrix has spare capacity; only its first len(GLOBAL_EMBEDDING_ROWS) rows are used
+GLOBAL_EMBEDDING_MATRIX = None
+GLOBAL_EMBEDDING_ROWS = {}
 
 
 @register_ibs_method
 def tbd_embedding(ibs, aid_list, config=None, use_depc=True):
     r"""
-    Generate embeddings using the Pose-Invariant Embedding (TBD)
+    Generate embeddings using the Pose-Invariant Embedding (TBD).
+    Returned embeddings are L2-normalized and stored in float16.
     Args:
         ibs (IBEISController): IBEIS / WBIA controller object
         aid_list  (int): annot ids specifying the input
@@ -112,12 +131,11 @@ def tbd_embedding(ibs, aid_list, config=None, use_depc=True):
         >>> assert abs(rank1 - expected_rank1) < 1e-2
 
     """
-    global GLOBAL_EMBEDDING_CACHE
+    global GLOBAL_EMBEDDING_MATRIX
 
-    dirty_aids = []
-    for aid in aid_list:
-        if aid not in GLOBAL_EMBEDDING_CACHE:
-            dirty_aids.append(aid)
+    dirty_aids = [
+        aid for aid in ut.unique(aid_list) if aid not in GLOBAL_EMBEDDING_ROWS
+    ]
 
     if len(dirty_aids) > 0:
         print('Computing %d non-cached embeddings' % (len(dirty_aids), ))
@@ -129,10 +147,37 @@ def tbd_embedding(ibs, aid_list, config=None, use_depc=True):
         else:
             dirty_embeddings = tbd_compute_embedding(ibs, dirty_aids, config)
 
-        for dirty_aid, dirty_embedding in zip(dirty_aids, dirty_embeddings):
-            GLOBAL_EMBEDDING_CACHE[dirty_aid] = dirty_embedding
-
-    embeddings = ut.take(GLOBAL_EMBEDDING_CACHE, aid_list)
+        dirty_embeddings = np.array(dirty_embeddings, dtype=np.float32)
+        # Cache unit-norm rows so cosine distance reduces to a single matmul.
+        # Unit-norm components fit float16 well, which halves the cache size
+        norms = np.linalg.norm(dirty_embeddings, axis=1, keepdims=True)
+        dirty_embeddings /= np.maximum(norms, 1e-12)
+        dirty_embeddings = dirty_embeddings.astype(np.float16)
+
+        start = len(GLOBAL_EMBEDDING_ROWS)
+        end = start + len(dirty_aids)
+        if GLOBAL_EMBEDDING_MATRIX is None or end > len(GLOBAL_EMBEDDING_MATRIX):
+            # Grow geometrically so adding a few rows at a time stays amortized O(1)
+            capacity = 0 if GLOBAL_EMBEDDING_MATRIX is None else len(GLOBAL_EMBEDDING_MATRIX)
+            capacity = max(end, 2 * capacity)
+            matrix = np.empty(
+                (capacity, dirty_embeddings.shape[1]), dtype=np.float16
+            )
+            if start > 0:
+                matrix[:start] = GLOBAL_EMBEDDING_MATRIX[:start]
+            GLOBAL_EMBEDDING_MATRIX = matrix
+        GLOBAL_EMBEDDING_MATRIX[start:end] = dirty_embeddings
+        GLOBAL_EMBEDDING_ROWS.update(zip(dirty_aids, range(start, end)))
+
+    if GLOBAL_EMBEDDING_MATRIX is None:
+        return np.empty((0, 0), dtype=np.float16)
+
+    rows = np.fromiter(
+        (GLOBAL_EMBEDDING_ROWS[aid] for aid in aid_list),
+        dtype=np.int64,
+        count=len(aid_list),
+    )
+    embeddings = GLOBAL_EMBEDDING_MATRIX[: len(GLOBAL_EMBEDDING_ROWS)][rows]
 
     return embeddings
 
@@ -161,34 +206,106 @@ def tbd_embedding_depc(depc, aid_list, config=None):
 
 
 @register_ibs_method
-def tbd_compute_embedding(ibs, aid_list, config=None, multithread=False):
+def tbd_compute_embedding(ibs, aid_list, config=None, multithread=True):
     # Get species from the first annotation
     species = ibs.get_annot_species_texts(aid_list[0])
 
     # Load config
     if config is None:
         config = CONFIGS[species]
-    config = _load_config(config)
+    config_url = config
+    config = _load_config(config_url)
 
-    # Load model
-    model = _load_model(config, MODELS[species])
+    # Load model, reused across calls
+    loaded = _get_model(config_url, MODELS[species])
+    model = loaded.model
 
     # Preprocess images to model input
     test_loader, test_dataset = _load_data(ibs, aid_list, config, multithread)
 
     # Compute embeddings
-    embeddings = []
+    embeddings = None
+    start = 0
     model.eval()
-    with torch.no_grad():
-        for images, names in test_loader:
+    use_graph = config.use_gpu
+    # Half precision on GPU; autocast's weight cache is disabled so it can be graph captured
+    if config.use_gpu:
+        autocast = torch.autocast(
+            device_type='cuda', dtype=torch.float16, cache_enabled=False
+        )
+    else:
+        autocast = contextlib.nullcontext()
+    # The loader yields resized uint8 images, normalized here a batch at a time.
+    # On GPU, the next batch is copied to the device and normalized there while
+    # the current one is processed
+    normalize = NormalizeBatch()
+    if config.use_gpu:
+        batches = CudaPrefetcher(
+            test_loader, memory_format=torch.channels_last, transform=normalize
+        )
+    else:
+        batches = ((normalize(images), names) for images, names in test_loader)
+    # Graph replays share static buffers, so only one caller may use them at a time
+    lock = loaded.lock if use_graph else contextlib.nullcontext()
+    with torch.inference_mode(), autocast, lock:
+        if use_graph:
+            input_shape = (config.test.batch_size, 3) + tuple(config.data.image_size)
+            if input_shape not in loaded.graphs:
+                loaded.graphs[input_shape] = _capture_model(model, input_shape)
+            graph, static_input, static_output = loaded.graphs[input_shape]
+
+        for images, names in batches:
+            if use_graph:
+                # The last batch may be smaller; pad by reusing the static buffer
+                batch_size = images.shape[0]
+                static_input[:batch_size].copy_(images, non_blocking=True)
+                graph.replay()
+                output = static_output[:batch_size]
+            else:
+                output = model(images)
             if config.use_gpu:
-                images = images.cuda(non_blocking=True)
+                # The embedding cache keeps float16 anyway, so halve the copy to host
+                output = output.half()
+            if embeddings is None:
+                # Host buffer for all embeddings, sized once the output dim is known.
+                # It is pinned on GPU so each batch is copied into it asynchronously
+                embeddings = torch.empty(
+                    (len(test_dataset), output.shape[1]),
+                    dtype=output.dtype,
+                    pin_memory=config.use_gpu,
+                )
+            end = start + output.shape[0]
+            embeddings[start:end].copy_(output, non_blocking=True)
+            start = end
 
-            output = model(images.float())
-            embeddings.append(output.detach().cpu().numpy())
+        if config.use_gpu:
+            # Also makes sure the last copy out of static_output is done before unlocking
+            torch.cuda.synchronize()
+    # Upcast the half precision copies from the GPU once, here
+    return embeddings.float().numpy()
 
-    embeddings = np.concatenate(embeddings)
-    return embeddings
+
+def _capture_model(model, input_shape, warmup_iters=3):
+    r"""
+    Capture the model forward for a fixed input shape as a CUDA graph.
+    Batches are fed by copying into static_input before replaying the graph.
+    """
+    static_input = torch.zeros(input_shape, device='cuda').contiguous(
+        memory_format=torch.channels_last
+    )
+
+    # Warmup on a side stream so lazy initialization isn't captured
+    stream = torch.cuda.Stream()
+    stream.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(stream):
+        for _ in range(warmup_iters):
+            model(static_input)
+    torch.cuda.current_stream().wait_stream(stream)
+
+    graph = torch.cuda.CUDAGraph()
+    with torch.cuda.graph(graph):
+        static_output = model(static_input)
+    return graph, static_input, static_output
 
 
 class TbdConfig(dt.Config):  # NOQA
@@ -199,34 +316,60 @@ class TbdConfig(dt.Config):  # NOQA
         ]
 
 
+def _np_group_indices(arr):
+    r"""
+    Numpy equivalent of ut.group_indices: sorted unique values and the indices
+    of each group, with indices kept in their original order within a group
+    """
+    arr = np.asarray(arr)
+    sortx = np.argsort(arr, kind='stable')
+    uniques, starts = np.unique(arr[sortx], return_index=True)
+    groupxs = np.split(sortx, starts[1:]) if len(arr) else []
+    return uniques, groupxs
+
+
+def _grouped_max(values, groupxs):
+    r"""
+    Max of values within each group of indices, computed in a single reduction
+    """
+    if len(groupxs) == 0:
+        return np.empty(0, dtype=values.dtype)
+    group_lens = [len(groupx) for groupx in groupxs]
+    flat_values = values[np.concatenate(groupxs)]
+    offsets = np.cumsum([0] + group_lens[:-1])
+    return np.maximum.reduceat(flat_values, offsets)
+
+
 def get_match_results(depc, qaid_list, daid_list, score_list, config):
     """ converts table results into format for ipython notebook """
     # qaid_list, daid_list = request.get_parent_rowids()
     # score_list = request.score_list
     # config = request.config
 
-    unique_qaids, groupxs = ut.group_indices(qaid_list)
-    # grouped_qaids_list = ut.apply_grouping(qaid_list, groupxs)
-    grouped_daids = ut.apply_grouping(daid_list, groupxs)
-    grouped_scores = ut.apply_grouping(score_list, groupxs)
+    # Convert to arrays once; groups are then taken by indexing
+    qaid_list = np.asarray(qaid_list)
+    daid_list = np.asarray(daid_list)
+    score_list = np.asarray(score_list)
+
+    unique_qaids, groupxs = _np_group_indices(qaid_list)
+    unique_qaids = unique_qaids.tolist()
 
     ibs = depc.controller
     unique_qnids = ibs.get_annot_nids(unique_qaids)
 
-    # scores
-    _iter = zip(unique_qaids, unique_qnids, grouped_daids, grouped_scores)
-    for qaid, qnid, daids, scores in _iter:
-        dnids = ibs.get_annot_nids(daids)
+    # Look up the names of all daids in one query rather than once per qaid
+    unique_daids, daid_inverse = np.unique(daid_list, return_inverse=True)
+    dnid_list = np.array(ibs.get_annot_nids(unique_daids.tolist()))[daid_inverse]
 
-        # Remove distance to self
-        annot_scores = np.array(scores)
-        daid_list_ = np.array(daids)
-        dnid_list_ = np.array(dnids)
+    # Remove distance to self
+    is_valid = daid_list != qaid_list
 
-        is_valid = daid_list_ != qaid
-        daid_list_ = daid_list_.compress(is_valid)
-        dnid_list_ = dnid_list_.compress(is_valid)
-        annot_scores = annot_scores.compress(is_valid)
+    # scores
+    for qaid, qnid, groupx in zip(unique_qaids, unique_qnids, groupxs):
+        groupx = groupx[is_valid[groupx]]
+        daid_list_ = daid_list[groupx]
+        dnid_list_ = dnid_list[groupx]
+        annot_scores = score_list[groupx]
 
         # Hacked in version of creating an annot match object
         match_result = wbia.AnnotMatch()
@@ -237,8 +380,7 @@ def get_match_results(depc, qaid_list, daid_list, score_list, config):
         match_result._update_daid_index()
         match_result._update_unique_nid_index()
 
-        grouped_annot_scores = vt.apply_grouping(annot_scores, match_result.name_groupxs)
-        name_scores = np.array([np.max(dists) for dists in grouped_annot_scores])
+        name_scores = _grouped_max(annot_scores, match_result.name_groupxs)
         match_result.set_cannonical_name_score(annot_scores, name_scores)
         yield match_result
 
@@ -300,37 +442,49 @@ def wbia_plugin_tbd(depc, qaid_list, daid_list, config):
 
     use_knn = config.get('use_knn', True)
 
-    qaid_score_dict = {}
-    for qaid in tqdm.tqdm(qaids):
-        if use_knn:
-                tbd_dists = ibs.tbd_predict_light(
-                    qaid,
-                    daids,
-                    config['config_path'],
-                )
+    # Fetch all embeddings once; distances are computed a block of queries at a time
+    query_embs = ibs.tbd_embedding(qaids, config['config_path'])
+    db_embs = ibs.tbd_embedding(daids, config['config_path'])
+    distmat_blocks = blocked_normalized_cosine_distance(
+        query_embs, db_embs, use_gpu=torch.cuda.is_available()
+    )
+
+    if use_knn:
+        # Only the nearest daids of each query are scored, the rest default to 0
+        knn_scores = {}
+        db_labels = np.array(daids)
+        progress = tqdm.tqdm(total=len(qaids))
+        for start, distmat in distmat_blocks:
+            tbd_dists_list = pred_light_distmat(distmat, db_labels)
+            for qaid, tbd_dists in zip(qaids[start:], tbd_dists_list):
                 tbd_scores = distance_dicts_to_score_dicts(tbd_dists)
+                for daid, score in tbd_scores.items():
+                    knn_scores[(qaid, daid)] = score
+            progress.update(len(distmat))
+        progress.close()
 
-                # aid_score_list = aid_scores_from_name_scores(ibs, tbd_name_scores, daids)
-                aid_score_list = aid_scores_from_score_dict(tbd_scores, daids)
-                aid_score_dict = dict(zip(daids, aid_score_list))
+        def get_score(qaid, daid):
+            return knn_scores.get((qaid, daid), 0.0)
 
-                qaid_score_dict[qaid] = aid_score_dict
-        else:
-            tbd_annot_distances = ibs.tbd_predict_light_distance(
-                qaid,
-                daids,
-                config['config_path'],
-            )
-            qaid_score_dict[qaid] = {}
-            for daid, tbd_annot_distance in zip(daids, tbd_annot_distances):
-                qaid_score_dict[qaid][daid] = distance_to_score(tbd_annot_distance)
+    else:
+        # Every pair is scored, so keep them in a (qaid, daid) matrix
+        qaid_index = {qaid: index for index, qaid in enumerate(qaids)}
+        daid_index = {daid: index for index, daid in enumerate(daids)}
+        qaid_scores = np.empty((len(qaids), len(daids)), dtype=np.float64)
+        for start, distmat in distmat_blocks:
+            # distance_to_score for cosine distance, applied to the whole block
+            qaid_scores[start : start + len(distmat)] = (
+                2.0 - distmat.astype(np.float64)
+            ) / 2.0
+
+        def get_score(qaid, daid):
+            return qaid_scores[qaid_index[qaid], daid_index[daid]]
 
     for qaid, daid in zip(qaid_list, daid_list):
         if qaid == daid:
             daid_score = 0.0
         else:
-            aid_score_dict = qaid_score_dict.get(qaid, {})
-            daid_score = aid_score_dict.get(daid)
+            daid_score = get_score(qaid, daid)
         yield (daid_score,)
 
 
@@ -339,13 +493,29 @@ def evaluate_distmat(ibs, aid_list, config, use_depc, ranks=[1, 5, 10, 20]):
     """Evaluate 1vsall accuracy of matching on annotations by
     computing distance matrix.
     """
-    embs = np.array(tbd_embedding(ibs, aid_list, config, use_depc))
+    embs = tbd_embedding(ibs, aid_list, config, use_depc)
     print('Computing distance matrix ...')
-    distmat = compute_distance_matrix(embs, embs, metric='cosine')
+    if torch.cuda.is_available():
+        # Rank on the GPU as well, so only the sorted indices come back to the
+        # host instead of the N x N distance matrix. Rows are done in blocks to
+        # bound device memory
+        embs = torch.from_numpy(embs).cuda()
+        num_embs = embs.shape[0]
+        block_size = 1024
+        indices = np.empty((num_embs, num_embs), dtype=np.int32)
+        for start in range(0, num_embs, block_size):
+            block = normalized_cosine_distance(embs[start : start + block_size], embs)
+            indices[start : start + block_size] = (
+                torch.argsort(block, dim=1).int().cpu().numpy()
+            )
+        distmat = None
+    else:
+        distmat = normalized_cosine_distance(embs, embs)
+        indices = None
 
     print('Computing ranks ...')
     db_labels = np.array(ibs.get_annot_name_rowids(aid_list))
-    cranks, mAP = eval_onevsall(distmat, db_labels)
+    cranks, mAP = eval_onevsall(distmat, db_labels, indices=indices)
 
     print('** Results **')
     print('mAP: {:.1%}'.format(mAP))
@@ -354,9 +524,10 @@ def evaluate_distmat(ibs, aid_list, config, use_depc, ranks=[1, 5, 10, 20]):
     return cranks[0]
 
 
+@functools.lru_cache(maxsize=4)
 def _load_config(config_url):
     r"""
-    Load a configuration file
+    Load a configuration file. Cached by url; the returned config is shared.
     """
     config_fname = config_url.split('/')[-1]
     config_file = ut.grab_file_url(
@@ -365,7 +536,7 @@ def _load_config(config_url):
 
     config = get_config(config_file)
     config.use_gpu = torch.cuda.is_available()
-    config.engine.device = 'cuda' if config.use_gpu else 'cpu'
+    config.engine = replace(config.engine, device='cuda' if config.use_gpu else 'cpu')
     # config.merge_from_file(config_file)
     return config
 
@@ -399,16 +570,39 @@ def _load_model(config, model_url):
     #    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
     # print('Loaded model from {}'.format(model_path))
     if config.use_gpu:
-        model = torch.nn.DataParallel(model).cuda()
+        model = model.cuda().to(memory_format=torch.channels_last)
     return model
 
 
-def _load_data(ibs, aid_list, config, multithread=False):
+class _LoadedModel(object):
+    r"""
+    A loaded model together with the CUDA graphs captured from it, keyed by
+    input shape. Graphs hold raw pointers to the model's parameters without
+    keeping it alive, so they are kept here and freed along with the model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.graphs = {}
+        self.lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(config_url, model_url):
+    r"""
+    Load a model once per (config_url, model_url) and keep it warm for later calls
+    """
+    config = _load_config(config_url)
+    return _LoadedModel(_load_model(config, model_url))
+
+
+def _load_data(ibs, aid_list, config, multithread=True):
     r"""
     Load data, preprocess and create data loaders
     """
 
-    test_transform = get_test_transforms(config)
+    # Only resizing happens in the loader; normalization is done per batch
+    test_transform = get_test_resize_transforms(config)
 
     image_paths = ibs.get_annot_image_paths(aid_list)
     bboxes = ibs.get_annot_bboxes(aid_list)
@@ -425,18 +619,26 @@ def _load_data(ibs, aid_list, config, multithread=False):
         fliplr_view=config.test.fliplr_view,
     )
 
-    if multithread:
-        num_workers = config.data.workers
-    else:
-        num_workers = 0
+    loader_kwargs = {}
+    num_batches = math.ceil(len(dataset) / config.test.batch_size)
+    # A single batch is loaded on the main thread; forking workers costs more
+    if multithread and num_batches > 1:
+        # Decode and transform in worker processes, ahead of the GPU.
+        # As in training, None means half the CPUs and 0 means no workers
+        num_workers = config.engine.num_workers
+        if num_workers is None:
+            num_workers = max(1, (os.cpu_count() or 2) // 2)
+        num_workers = min(num_workers, num_batches)
+        if num_workers > 0:
+            loader_kwargs.update(num_workers=num_workers, prefetch_factor=4)
 
     dataloader = torch.utils.data.DataLoader(
         dataset,
         batch_size=config.test.batch_size,
         shuffle=False,
-        num_workers=num_workers,
         pin_memory=True,
         drop_last=False,
+        **loader_kwargs
     )
     print('Loaded {} images for model evaluation'.format(len(dataset)))
 
@@ -496,35 +698,33 @@ def wbia_tbd_test_ibs(demo_db_url, species, subset):
 
 @register_ibs_method
 def tbd_predict_light(ibs, qaid, daid_list, config=None):
-    db_embs = np.array(ibs.tbd_embedding(daid_list, config))
-    query_emb = np.array(ibs.tbd_embedding([qaid], config))
+    db_embs = ibs.tbd_embedding(daid_list, config)
+    query_emb = ibs.tbd_embedding([qaid], config)
 
     # db_labels = np.array(ibs.get_annot_name_texts(daid_list, distinguish_unknowns=True))
     db_labels = np.array(daid_list)
 
-    ans = pred_light(query_emb, db_embs, db_labels)
+    ans = pred_light(
+        query_emb.astype(np.float32), db_embs.astype(np.float32), db_labels
+    )
     return ans
 
 
 @register_ibs_method
 def tbd_predict_light_distance(ibs, qaid, daid_list, config=None):
     assert len(daid_list) == len(set(daid_list))
-    db_embs = np.array(ibs.tbd_embedding(daid_list, config))
-    query_emb = np.array(ibs.tbd_embedding([qaid], config))
+    db_embs = ibs.tbd_embedding(daid_list, config)
+    query_emb = ibs.tbd_embedding([qaid], config)
 
-    input1 = torch.Tensor(query_emb)
-    input2 = torch.Tensor(db_embs)
-    distmat = compute_distance_matrix(input1, input2, metric='cosine')
-    distances = np.array(distmat[0])
+    distmat = normalized_cosine_distance(
+        query_emb, db_embs, use_gpu=torch.cuda.is_available()
+    )
+    distances = distmat[0]
     return distances
 
 
-def _tbd_accuracy(ibs, qaid, daid_list):
-    daids = daid_list.copy()
-    daids.remove(qaid)
-    ans = ibs.tbd_predict_light(qaid, daids)
+def _tbd_accuracy(ans, ground_truth):
     ans_names = [row['label'] for row in ans]
-    ground_truth = ibs.get_annot_name_texts(qaid)
     try:
         rank = ans_names.index(ground_truth) + 1
     except ValueError:
@@ -536,7 +736,27 @@ def _tbd_accuracy(ibs, qaid, daid_list):
 def tbd_mass_accuracy(ibs, aid_list, daid_list=None):
     if daid_list is None:
         daid_list = aid_list
-    ranks = [_tbd_accuracy(ibs, aid, daid_list) for aid in aid_list]
+    # Rank queries against the db a block of rows at a time, with each
+    # query's own column excluded
+    query_embs = ibs.tbd_embedding(aid_list)
+    db_embs = ibs.tbd_embedding(daid_list)
+    daid_index = {daid: index for index, daid in reversed(list(enumerate(daid_list)))}
+    self_index = np.array([daid_index[aid] for aid in aid_list], dtype=np.int64)
+
+    db_labels = np.array(daid_list)
+    n_results = min(50, len(daid_list) - 1)
+    ground_truths = ibs.get_annot_name_texts(aid_list)
+    ranks = []
+    for start, distmat in blocked_normalized_cosine_distance(
+        query_embs, db_embs, use_gpu=torch.cuda.is_available()
+    ):
+        end = start + distmat.shape[0]
+        distmat[np.arange(distmat.shape[0]), self_index[start:end]] = np.inf
+        ans_list = pred_light_distmat(distmat, db_labels, n_results=n_results)
+        ranks += [
+            _tbd_accuracy(ans, ground_truth)
+            for ans, ground_truth in zip(ans_list, ground_truths[start:end])
+        ]
     return ranks
 
 
@@ -631,23 +851,19 @@ def aid_scores_from_score_dict(name_score_dict, daid_list):
     return daid_scores
 
 def aid_scores_from_name_scores(ibs, name_score_dict, daid_list):
-    daid_name_list = list(_db_labels_for_tbd(ibs, daid_list))
-
-    name_count_dict = {
-        name: daid_name_list.count(name) for name in name_score_dict.keys()
-    }
+    daid_name_list = _db_labels_for_tbd(ibs, daid_list)
 
-    name_annotwise_score_dict = {
-        name: name_score_dict[name] / name_count_dict[name]
-        for name in name_score_dict.keys()
-    }
-
-    from collections import defaultdict
-
-    name_annotwise_score_dict = defaultdict(float, name_annotwise_score_dict)
+    # Each name's score is split evenly over its annotations
+    unique_names, name_index, name_counts = np.unique(
+        daid_name_list, return_inverse=True, return_counts=True
+    )
+    name_scores = np.array(
+        [name_score_dict.get(name, 0.0) for name in unique_names.tolist()]
+    )
+    name_annotwise_scores = name_scores / name_counts
 
     # bc daid_name_list is in the same order as daid_list
-    daid_scores = [name_annotwise_score_dict[name] for name in daid_name_list]
+    daid_scores = name_annotwise_scores[name_index].tolist()
     return daid_scores
 
 
@@ -1,3 +1,4 @@
 from .default_dataset import *
 from .transforms import *
-from .plugin_dataset import *
\ No newline at end of file
+from .plugin_dataset import *
+from .prefetcher import *
\ No newline at end of file
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import torch
+
+
+class CudaPrefetcher(object):
+    """Iterates over a DataLoader and copies the next batch of images to the GPU
+    on a side stream while the current batch is being processed.
+    The DataLoader should use pin_memory=True for the copies to be asynchronous.
+    Batches are expected to be (images, ...) tuples; only images are moved.
+    An optional transform is applied to the images on the device, on the same
+    side stream, so preprocessing also overlaps the current batch.
+    """
+
+    def __init__(self, loader, memory_format=torch.contiguous_format, transform=None):
+        self.loader = loader
+        self.memory_format = memory_format
+        self.transform = transform
+        self.stream = torch.cuda.Stream()
+
+    def _preload(self):
+        try:
+            images, *rest = next(self._iter)
+        except StopIteration:
+            return None
+
+        with torch.cuda.stream(self.stream):
+            images = images.cuda(non_blocking=True)
+            if self.transform is not None:
+                images = self.transform(images)
+            images = images.contiguous(memory_format=self.memory_format)
+        return (images, *rest)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self._iter = iter(self.loader)
+        next_batch = self._preload()
+        while next_batch is not None:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            batch = next_batch
+            # The images were allocated on the side stream but are used on the current one
+            batch[0].record_stream(torch.cuda.current_stream())
+            next_batch = self._preload()
+            yield batch
@@ -1,5 +1,6 @@
 import numpy
 import cv2
+import torch
 import glob
 import albumentations
 from albumentations.core.transforms_interface import ImageOnlyTransform
@@ -70,4 +71,39 @@ def get_test_transforms(config):
             albumentations.Normalize(),
         ToTensorV2(p=1.0)
         ]
-    )
\ No newline at end of file
+    )
+
+
+# Resize only; images stay uint8 HWC so batches are a quarter of the size to
+# copy to the device, where NormalizeBatch finishes the preprocessing
+def get_test_resize_transforms(config):
+
+    return albumentations.Compose(
+        [
+            albumentations.Resize(config.data.image_size[0],config.data.image_size[1],always_apply=True),
+        ]
+    )
+
+
+class NormalizeBatch(object):
+    """Batched equivalent of albumentations.Normalize followed by ToTensorV2.
+    Takes a (B, H, W, C) uint8 tensor on any device and returns normalized
+    float (B, C, H, W) images in channels_last memory format.
+    """
+
+    def __init__(self, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225), max_pixel_value=255.0):
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1) * max_pixel_value
+        self.std = torch.tensor(std).view(1, -1, 1, 1) * max_pixel_value
+        # mean and std copies per device, so they are only moved once
+        self._device_stats = {}
+
+    def _stats(self, device):
+        if device not in self._device_stats:
+            self._device_stats[device] = (self.mean.to(device), self.std.to(device))
+        return self._device_stats[device]
+
+    def __call__(self, images):
+        # Permuting HWC to CHW gives a channels_last view, which float() keeps
+        images = images.permute(0, 3, 1, 2).float()
+        mean, std = self._stats(images.device)
+        return images.sub_(mean).div_(std)
@@ -7,18 +7,19 @@ import wandb
 from metrics import AverageMeter, compute_distance_matrix, eval_onevsall
 
 
-def eval_fn(data_loader,model,device, use_wandb=True):
+def eval_fn(data_loader,model,device, use_wandb=True, use_amp=False):
 
     model.eval()
     tk0 = tqdm(data_loader, total=len(data_loader))
     embeddings = []
     labels = []
     
-    with torch.no_grad():
+    with torch.no_grad(), torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
         for batch in tk0:
-            batch_embeddings = model.extract_feat(batch["image"].to(device))
+            images = batch["image"].to(device, non_blocking=True, memory_format=torch.channels_last)
+            batch_embeddings = model.extract_feat(images)
             
-            batch_embeddings = batch_embeddings.detach().cpu().numpy()
+            batch_embeddings = batch_embeddings.detach().float().cpu().numpy()
             
             image_idx = batch["image_idx"].tolist()
             batch_embeddings_df = pd.DataFrame(batch_embeddings, index=image_idx)
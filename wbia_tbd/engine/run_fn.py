@@ -7,17 +7,18 @@ from .train_fn import train_fn
 from .eval_fn import eval_fn
 
 
-def run_fn(config, model, train_loader, valid_loader, criterion, optimizer, scheduler, device, checkpoint_dir, use_wandb=True):
+def run_fn(config, model, train_loader, valid_loader, criterion, optimizer, scheduler, device, checkpoint_dir, use_wandb=True, use_amp=False, use_cuda_graph=False):
 
     best_loss = np.inf
     for epoch in range(config.engine.epochs):
 
-        train_loss = train_fn(train_loader, model,criterion, optimizer, device,scheduler=scheduler,epoch=epoch, use_wandb=use_wandb)
+        train_loss = train_fn(train_loader, model,criterion, optimizer, device,scheduler=scheduler,epoch=epoch, use_wandb=use_wandb, use_amp=use_amp, use_cuda_graph=use_cuda_graph)
 
         
-        torch.save(model.state_dict(), f'{checkpoint_dir}/model_{epoch}.bin')
+        # Save the wrapped module of a compiled model so checkpoint keys stay unprefixed
+        torch.save(getattr(model, '_orig_mod', model).state_dict(), f'{checkpoint_dir}/model_{epoch}.bin')
         
-        valid_loss = eval_fn(valid_loader, model, device, use_wandb=use_wandb)
+        valid_loss = eval_fn(valid_loader, model, device, use_wandb=use_wandb, use_amp=use_amp)
         
         # if valid_loss.avg < best_loss:
         #     best_loss = valid_loss.avg
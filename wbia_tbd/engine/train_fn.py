@@ -1,11 +1,47 @@
+import torch
 from tqdm.auto import tqdm
 import wandb
 from metrics import AverageMeter
 
 
-def train_fn(dataloader,model,criterion,optimizer,device,scheduler,epoch, use_wandb=True):
+CUDA_GRAPH_WARMUP_STEPS = 3
+
+
+def train_step(model, criterion, optimizer, images, targets, use_amp=False):
+    optimizer.zero_grad(set_to_none=True)
+
+    with torch.autocast(device_type=images.device.type, dtype=torch.bfloat16, enabled=use_amp):
+        output = model(images,targets)
+
+        loss = criterion(output,targets)
+    
+    loss.backward()
+    optimizer.step()
+    return loss
+
+
+def capture_train_step(model, criterion, optimizer, images, targets, use_amp=False):
+    """Captures a full training step as a CUDA graph.
+
+    The graph reads its inputs from static copies of images and targets, so
+    batches are fed by copying into them before each replay. The learning rate
+    is baked into the graph, so it has to be recaptured after the scheduler steps.
+
+    Returns:
+        tuple: (graph, static_images, static_targets, static_loss)
+    """
+    static_images = images.clone(memory_format=torch.channels_last)
+    static_targets = targets.clone()
+    graph = torch.cuda.CUDAGraph()
+    with torch.cuda.graph(graph):
+        static_loss = train_step(model, criterion, optimizer, static_images, static_targets, use_amp=use_amp)
+    return graph, static_images, static_targets, static_loss
+
+
+def train_fn(dataloader,model,criterion,optimizer,device,scheduler,epoch, use_wandb=True, use_amp=False, use_cuda_graph=False):
     model.train()
     loss_score = AverageMeter()
+    graph = None
     tk0 = tqdm(enumerate(dataloader), total=len(dataloader))
     for bi,d in tk0:
         images = d['image']
@@ -14,17 +50,24 @@ def train_fn(dataloader,model,criterion,optimizer,device,scheduler,epoch, use_wa
 
 
  
-        images = images.to(device)
-        targets = targets.to(device)
-
-        optimizer.zero_grad()
+        images = images.to(device, non_blocking=True, memory_format=torch.channels_last)
+        targets = targets.to(device, non_blocking=True)
 
-        output = model(images,targets)
-        
-        loss = criterion(output,targets)
-        
-        loss.backward()
-        optimizer.step()
+        if not use_cuda_graph:
+            loss = train_step(model, criterion, optimizer, images, targets, use_amp=use_amp)
+        elif bi < CUDA_GRAPH_WARMUP_STEPS:
+            # Warmup steps run eagerly on a side stream before capture
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                loss = train_step(model, criterion, optimizer, images, targets, use_amp=use_amp)
+            torch.cuda.current_stream().wait_stream(stream)
+        else:
+            if graph is None:
+                graph, static_images, static_targets, loss = capture_train_step(model, criterion, optimizer, images, targets, use_amp=use_amp)
+            static_images.copy_(images, non_blocking=True)
+            static_targets.copy_(targets, non_blocking=True)
+            graph.replay()
         
         loss_score.update(loss.detach().item(), batch_size)
         tk0.set_postfix(Train_Loss=loss_score.avg,Epoch=epoch,LR=optimizer.param_groups[0]['lr'])
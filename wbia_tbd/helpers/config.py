@@ -1,9 +1,15 @@
+import os
+import json
+import tempfile
 import yaml
+import functools
 from dataclasses import dataclass, field
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 
 from dataclasses import asdict
 
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 def dataclass_to_dict(dataclass_instance):
     return asdict(dataclass_instance)
 
@@ -11,7 +17,7 @@ class DictableClass:
     def __iter__(self):
         yield from dataclass_to_dict(self).items()
 
-@dataclass
+@dataclass(frozen=True)
 class Data(DictableClass):
     images_dir: str
     train_anno_path: str
@@ -25,7 +31,7 @@ class Data(DictableClass):
     name_keys: List = field(default_factory=['name'])
 
 
-@dataclass
+@dataclass(frozen=True)
 class Engine(DictableClass):
     train_batch_size: int
     valid_batch_size: int
@@ -34,11 +40,15 @@ class Engine(DictableClass):
     device: str
     loss_module: str
     use_wandb: bool
-    num_workers: int = 0
+    num_workers: Optional[int] = None
+    use_amp: bool = False
+    deterministic: bool = True
+    use_cuda_graph: bool = False
+    use_compile: bool = False
 
 
 
-@dataclass
+@dataclass(frozen=True)
 class SchedulerParams(DictableClass):
     lr_start: float
     lr_max: float
@@ -47,7 +57,7 @@ class SchedulerParams(DictableClass):
     lr_sus_ep: int
     lr_decay: float
 
-@dataclass
+@dataclass(frozen=True)
 class ModelParams(DictableClass):
     model_name: str
     use_fc: bool
@@ -61,7 +71,7 @@ class ModelParams(DictableClass):
     pretrained: bool
     n_classes: int
 
-@dataclass
+@dataclass(frozen=True)
 class TestParams():
     batch_size: int = 4
     fliplr: bool = False
@@ -78,11 +88,50 @@ class Config(DictableClass):
     scheduler_params: SchedulerParams
     model_params: ModelParams
     test: TestParams
+
+    @functools.cached_property
+    def export_dict(self) -> dict:
+        # Computed on first access, i.e. after any overrides made during setup
+        return dataclass_to_dict(self)
     
 
-def get_config(file_path: str) -> Config:
+def _load_config_dict(file_path: str) -> dict:
+    # Parsed YAML is cached to a JSON sidecar, invalidated by mtime
+    cache_path = file_path + '.cache.json'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        try:
+            with open(cache_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            # Unreadable or corrupt sidecar; treat as a cache miss
+            pass
+
     with open(file_path, 'r') as file:
-        config_dict = yaml.safe_load(file)
+        config_dict = yaml.load(file, Loader=Loader)
+
+    try:
+        serialized = json.dumps(config_dict)
+    except (TypeError, ValueError):
+        # Values such as dates have no JSON form; skip caching this config
+        return config_dict
+
+    # Write to a temp file and rename it, so readers never see a partial sidecar
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(serialized)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+    return config_dict
+
+
+def get_config(file_path: str) -> Config:
+    config_dict = _load_config_dict(file_path)
 
     config_dict['data'] = Data(**config_dict['data'])
     config_dict['engine'] = Engine(**config_dict['engine'])
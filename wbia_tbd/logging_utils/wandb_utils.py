@@ -8,7 +8,7 @@ def init_wandb(exp_name, project_name, config=None):
     print('exp_name:', exp_name)
     print('project_name:', project_name)
 
-    export_config = {k:v for k,v in dict(vars(config)).items() if not k.startswith('__')} if config else None
+    export_config = config.export_dict if config else None
 
     run = wandb.init(project=project_name, name=exp_name, config=export_config)
     # wandb.config = config  # {"learning_rate": 0.001, "epochs": 100, "batch_size": 128}
@@ -1,4 +1,5 @@
 
+import numpy as np
 import torch
 import torch.nn.functional as F
 
@@ -35,6 +36,61 @@ def cosine_distance(input1, input2):
     distmat = 1 - torch.mm(input1_normed, input2_normed.t())
     return distmat
 
+def normalized_cosine_distance(input1, input2, use_gpu=False):
+    """Computes cosine distance between features that are already L2-normalized.
+
+    Float16 features are multiplied in half precision on the GPU and upcast
+    to float32 on the CPU, which has no fast half precision matmul.
+    Tensors are multiplied on their own device and the result is left there.
+
+    Args:
+        input1 (numpy.ndarray or torch.Tensor): 2-D normalized feature matrix.
+        input2 (numpy.ndarray or torch.Tensor): 2-D normalized feature matrix.
+        use_gpu (bool, optional): compute the matrix product of numpy inputs
+            on the GPU. Default is False.
+
+    Returns:
+        numpy.ndarray or torch.Tensor: float32 distance matrix.
+    """
+    if isinstance(input1, torch.Tensor):
+        return 1.0 - torch.mm(input1, input2.t()).float()
+    if use_gpu:
+        input1 = torch.from_numpy(np.ascontiguousarray(input1)).cuda()
+        input2 = torch.from_numpy(np.ascontiguousarray(input2)).cuda()
+        return normalized_cosine_distance(input1, input2).cpu().numpy()
+    input1 = np.asarray(input1, dtype=np.float32)
+    input2 = np.asarray(input2, dtype=np.float32)
+    return 1.0 - np.matmul(input1, input2.T)
+
+def blocked_normalized_cosine_distance(input1, input2, use_gpu=False, block_size=1024):
+    """Computes normalized_cosine_distance a block of input1 rows at a time,
+    so only a (block_size, len(input2)) matrix is held at once.
+
+    Args:
+        input1 (numpy.ndarray): 2-D normalized feature matrix.
+        input2 (numpy.ndarray): 2-D normalized feature matrix.
+        use_gpu (bool, optional): compute the matrix products on the GPU.
+            Default is False.
+        block_size (int, optional): number of input1 rows per block.
+            Default is 1024.
+
+    Yields:
+        tuple: (start, distmat) with the index of the first input1 row of the
+            block and its float32 distance matrix as a numpy.ndarray.
+    """
+    # input2 is moved or upcast once and shared by every block
+    if use_gpu:
+        input2 = torch.from_numpy(np.ascontiguousarray(input2)).cuda()
+    else:
+        input2 = np.asarray(input2, dtype=np.float32)
+    for start in range(0, len(input1), block_size):
+        block = input1[start : start + block_size]
+        if use_gpu:
+            block = torch.from_numpy(np.ascontiguousarray(block)).cuda()
+            yield start, normalized_cosine_distance(block, input2).cpu().numpy()
+        else:
+            yield start, normalized_cosine_distance(block, input2)
+
 def compute_distance_matrix(input1, input2, metric='euclidean'):
     """A wrapper function for computing distance matrix.
 
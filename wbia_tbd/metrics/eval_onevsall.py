@@ -1,14 +1,18 @@
 import numpy as np
 
-def eval_onevsall(distmat, q_pids, max_rank=50):
-    """Evaluation with one vs all on query set."""
-    num_q = distmat.shape[0]
+def eval_onevsall(distmat, q_pids, max_rank=50, indices=None):
+    """Evaluation with one vs all on query set.
+    indices, the argsort of distmat along rows, can be passed in when it has
+    already been computed elsewhere; distmat is then not used.
+    """
+    num_q = len(q_pids)
 
     if num_q < max_rank:
         max_rank = num_q
         print('Note: number of gallery samples is quite small, got {}'.format(num_q))
 
-    indices = np.argsort(distmat, axis=1)
+    if indices is None:
+        indices = np.argsort(distmat, axis=1)
     #    print('indices\n', indices)
 
     matches = (q_pids[indices] == q_pids[:, np.newaxis]).astype(np.int32)
@@ -64,6 +64,34 @@ def pred_light(query_embedding, db_embeddings, db_labels, n_results=50):
     return ans_dict
 
 
+def pred_light_distmat(distmat, db_labels, n_results=50):
+    """Get the nearest solutions from the database for every query, given a
+    precomputed query-to-database distance matrix.
+    Input:
+        distmat (float array): distances of size (num_query, num_db)
+        db_labels (str or int array): database labels of size (num_db,)
+        n_results (int): number of predictions to return per query
+    Returns:
+        list of ans_dict lists as returned by pred_light, one per query
+    """
+    n_results = min(n_results, distmat.shape[1])
+    if n_results == 0:
+        return [[] for _ in range(distmat.shape[0])]
+
+    # Select the nearest points per row, then sort only those
+    neigh_ind = np.argpartition(distmat, n_results - 1, axis=1)[:, :n_results]
+    neigh_dist = np.take_along_axis(distmat, neigh_ind, axis=1)
+    order = np.argsort(neigh_dist, axis=1, kind='stable')
+    neigh_ind = np.take_along_axis(neigh_ind, order, axis=1)
+    neigh_dist = np.take_along_axis(neigh_dist, order, axis=1)
+
+    ans_dicts = [
+        [{'label': lbl, 'distance': dist} for lbl, dist in zip(lbls, dists)]
+        for lbls, dists in zip(db_labels[neigh_ind].tolist(), neigh_dist.tolist())
+    ]
+    return ans_dicts
+
+
 def rem_dupl(seq, seq2=None):
     """Remove duplicates from a sequence and keep the order of elements.
     Do it in unison with a sequence 2."""
@@ -69,22 +69,34 @@ class ElasticArcFace(nn.Module):
         self.std=std
         self.plus=plus
     def forward(self, embbedings, label):
+        # acos/cos of the margin are too lossy in reduced precision
+        with torch.autocast(device_type=embbedings.device.type, enabled=False):
+            return self._forward(embbedings.float(), label)
+
+    def _forward(self, embbedings, label):
         embbedings = l2_norm(embbedings, axis=1)
         kernel_norm = l2_norm(self.kernel, axis=0)
         cos_theta = torch.mm(embbedings, kernel_norm)
         cos_theta = cos_theta.clamp(-1, 1)  # for numerical stability
-        index = torch.where(label != -1)[0]
-        m_hot = torch.zeros(index.size()[0], cos_theta.size()[1], device=cos_theta.device)
-        margin = torch.normal(mean=self.m, std=self.std, size=label[index, None].size(), device=cos_theta.device) # Fast converge .clamp(self.m-self.std, self.m+self.std)
         if self.plus:
+            index = torch.where(label != -1)[0]
+            m_hot = torch.zeros(index.size()[0], cos_theta.size()[1], device=cos_theta.device)
+            margin = torch.normal(mean=self.m, std=self.std, size=label[index, None].size(), device=cos_theta.device) # Fast converge .clamp(self.m-self.std, self.m+self.std)
             with torch.no_grad():
                 distmat = cos_theta[index, label.view(-1)].detach().clone()
                 _, idicate_cosie = torch.sort(distmat, dim=0, descending=True)
                 margin, _ = torch.sort(margin, dim=0)
             m_hot.scatter_(1, label[index, None], margin[idicate_cosie])
+            cos_theta.acos_()
+            cos_theta[index] += m_hot
         else:
-            m_hot.scatter_(1, label[index, None], margin)
-        cos_theta.acos_()
-        cos_theta[index] += m_hot
+            # Mask ignored labels instead of indexing so that shapes don't depend on
+            # the label values (no host sync, safe for CUDA graph capture)
+            valid = (label != -1).view(-1, 1)
+            margin = torch.normal(mean=self.m, std=self.std, size=valid.size(), device=cos_theta.device)
+            m_hot = torch.zeros_like(cos_theta)
+            m_hot.scatter_(1, label.clamp(min=0).view(-1, 1), margin * valid)
+            cos_theta.acos_()
+            cos_theta += m_hot
         cos_theta.cos_().mul_(self.s)
         return cos_theta
\ No newline at end of file
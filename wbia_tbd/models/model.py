@@ -37,7 +37,8 @@ class GeM(nn.Module):
         return self.gem(x, p=self.p, eps=self.eps)
         
     def gem(self, x, p=3, eps=1e-6):
-        return F.avg_pool2d(x.clamp(min=eps).pow(p), (x.size(-2), x.size(-1))).pow(1./p)
+        # Mean over the spatial dims reduces straight to (B, C)
+        return x.clamp_min(eps).pow(p).mean(dim=(-2, -1)).pow(1./p)
         
     def __repr__(self):
         return self.__class__.__name__ + \
@@ -59,13 +60,16 @@ class TbdNet(nn.Module):
                  margin=0.50,
                  ls_eps=0.0,
                  theta_zero=0.785,
-                 pretrained=True):
+                 pretrained=True,
+                 init_weights=True):
         """
         :param n_classes:
         :param model_name: name of model from pretrainedmodels
             e.g. resnet50, resnext101_32x4d, pnasnet5large
         :param pooling: One of ('SPoC', 'MAC', 'RMAC', 'GeM', 'Rpool', 'Flatten', 'CompactBilinearPooling')
         :param loss_module: One of ('arcface', 'cosface', 'softmax')
+        :param init_weights: apply Kaiming/classifier init to the head layers.
+            Can be disabled when a checkpoint is loaded right after construction.
         """
         super(TbdNet, self).__init__()
         print('Building Model Backbone for {} model'.format(model_name))
@@ -81,11 +85,12 @@ class TbdNet(nn.Module):
         self.use_fc = use_fc
         if use_fc:
             self.dropout = nn.Dropout(p=dropout)
-            self.bn = nn.BatchNorm1d(fc_dim)
-            self.bn.bias.requires_grad_(False)
-            self.fc = nn.Linear(final_in_features, n_classes, bias = False)            
-            self.bn.apply(weights_init_kaiming)
-            self.fc.apply(weights_init_classifier)
+            self.fc = nn.Linear(final_in_features, fc_dim, bias = False)
+            self.bn_fc = nn.BatchNorm1d(fc_dim)
+            self.bn_fc.bias.requires_grad_(False)
+            if init_weights:
+                self.bn_fc.apply(weights_init_kaiming)
+                self.fc.apply(weights_init_classifier)
             final_in_features = fc_dim
 
         self.loss_module = loss_module
@@ -100,10 +105,12 @@ class TbdNet(nn.Module):
             self.final = nn.Linear(final_in_features, n_classes)
 
     def _init_params(self):
-        nn.init.xavier_normal_(self.fc.weight)
-        nn.init.constant_(self.fc.bias, 0)
         nn.init.constant_(self.bn.weight, 1)
         nn.init.constant_(self.bn.bias, 0)
+        if self.use_fc:
+            nn.init.xavier_normal_(self.fc.weight)
+            nn.init.constant_(self.bn_fc.weight, 1)
+            nn.init.constant_(self.bn_fc.bias, 0)
 
     def forward(self, x, label=None):
         feature = self.extract_feat(x)
@@ -118,14 +125,12 @@ class TbdNet(nn.Module):
         return logits
 
     def extract_feat(self, x):
-        batch_size = x.shape[0]
         x = self.backbone(x)
-        x = self.pooling(x).view(batch_size, -1)
+        x = self.pooling(x)
         x = self.bn(x)
         if self.use_fc:
-            x1 = self.dropout(x)
-            x1 = self.bn(x1)
-            x1 = self.fc(x1)
-            
+            x = self.dropout(x)
+            x = self.fc(x)
+            x = self.bn_fc(x)
 
         return x
\ No newline at end of file
@@ -6,15 +6,19 @@ from .model import TbdNet
 
 def get_model(cfg, checkpoint_path=None, use_gpu=True):
 
-    model = TbdNet(**dict(cfg.model_params))
+    model_params = dict(cfg.model_params)
+    if checkpoint_path:
+        # Pretrained backbone weights and head init are overwritten by the checkpoint
+        model_params['pretrained'] = False
+    model = TbdNet(**model_params, init_weights=not checkpoint_path)
 
 
-    if use_gpu:
-        device = torch.device("cuda")
-        model.to(device)
+    device = torch.device("cuda") if use_gpu else torch.device("cpu")
+    model.to(device)
 
     if checkpoint_path:
-        model.load_state_dict(torch.load(checkpoint_path))
+        # Deserialize straight onto the target device to avoid a CPU staging copy
+        model.load_state_dict(torch.load(checkpoint_path, map_location=device))
         print('loaded checkpoint from', checkpoint_path)
 
     return model
\ No newline at end of file
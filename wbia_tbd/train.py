@@ -15,6 +15,7 @@ import numpy as np
 from dotenv import load_dotenv
 
 import argparse
+from dataclasses import replace
 
 # os.environ['CUDA_LAUNCH_BLOCKING'] = "1"
 # os.environ['TORCH_USE_CUDA_DSA'] = "1"
@@ -29,6 +30,18 @@ def parse_args():
     )
     return parser.parse_args()
 
+def get_loader_kwargs(device, num_workers=None):
+    # Pinned batches come from torch's caching host allocator and are reused across
+    # steps; pinning only pays off for asynchronous copies to a GPU
+    loader_kwargs = {'pin_memory': device.type == 'cuda'}
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 2) // 2)
+    loader_kwargs['num_workers'] = num_workers
+    if num_workers > 0:
+        # Keep workers alive across epochs and let them run ahead of the GPU
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=4)
+    return loader_kwargs
+
 def run(config_path):
     
     config = get_config(config_path)
@@ -38,15 +51,18 @@ def run(config_path):
     print('Checkpoints will be saved at: ', checkpoint_dir)
 
 
-    def set_seed_torch(seed):
+    def set_seed_torch(seed, deterministic=True):
         random.seed(seed)
-        os.environ['PYTHONHASHSEED'] = str(seed)
         np.random.seed(seed)
         torch.manual_seed(seed)
         torch.cuda.manual_seed(seed)
-        torch.backends.cudnn.deterministic = True
+        # deterministic and benchmark are mutually exclusive
+        torch.backends.cudnn.deterministic = deterministic
+        torch.backends.cudnn.benchmark = not deterministic
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
         
-    set_seed_torch(config.engine.seed)
+    set_seed_torch(config.engine.seed, deterministic=config.engine.deterministic)
 
     df_train = preprocess_data(config.data.train_anno_path, 
                                 name_keys=config.data.name_keys,
@@ -79,45 +95,54 @@ def run(config_path):
         transforms=get_valid_transforms(config),
     )
         
+    device = torch.device(config.engine.device)
+
+    loader_kwargs = get_loader_kwargs(device, config.engine.num_workers)
+
     train_loader = torch.utils.data.DataLoader(
         train_dataset,
         batch_size=config.engine.train_batch_size,
-        pin_memory=True,
         drop_last=True,
-        num_workers=config.engine.num_workers
+        **loader_kwargs
     )
 
     valid_loader = torch.utils.data.DataLoader(
         valid_dataset,
         batch_size=config.engine.valid_batch_size,
-        num_workers=config.engine.num_workers,
         shuffle=False,
-        pin_memory=True,
         drop_last=False,
+        **loader_kwargs
     )
 
-    device = torch.device(config.engine.device)
-
-    if config.model_params.n_classes != n_train_classes:
-        print(f"WARNING: Overriding n_classes in config ({config.model_params.n_classes}) which is different from actual n_train_classes ({n_train_classes}). This parameters has to be readjusted in config for proper checkpoint loading after training.")
-        config.model_params.n_classes = n_train_classes
-    model = TbdNet(**dict(config.model_params))
-    model.to(device)
+    model_params = config.model_params
+    if model_params.n_classes != n_train_classes:
+        print(f"WARNING: Overriding n_classes in config ({model_params.n_classes}) which is different from actual n_train_classes ({n_train_classes}). This parameters has to be readjusted in config for proper checkpoint loading after training.")
+        model_params = replace(model_params, n_classes=n_train_classes)
+        config.model_params = model_params
+    model = TbdNet(**dict(model_params))
+    model.to(device, memory_format=torch.channels_last)
 
     criterion = fetch_loss()
     criterion.to(device)
         
 
-    optimizer = torch.optim.Adam(model.parameters(), lr=config.scheduler_params.lr_start)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config.scheduler_params.lr_start, fused=(device.type == 'cuda'), capturable=config.engine.use_cuda_graph)
+
+    if config.engine.use_compile:
+        if config.engine.use_cuda_graph:
+            # The training step is captured by train_fn, so skip inductor's own CUDA graphs
+            model = torch.compile(model, options={'max_autotune': True})
+        else:
+            model = torch.compile(model, mode='max-autotune')
 
     scheduler = TbdScheduler(optimizer,**dict(config.scheduler_params))
 
 
     if config.engine.use_wandb:
         load_dotenv()
-        init_wandb(config.exp_name, config.project_name, config=None)
+        init_wandb(config.exp_name, config.project_name, config=config)
 
-    run_fn(config, model, train_loader, valid_loader, criterion, optimizer, scheduler, device, checkpoint_dir, use_wandb=config.engine.use_wandb)
+    run_fn(config, model, train_loader, valid_loader, criterion, optimizer, scheduler, device, checkpoint_dir, use_wandb=config.engine.use_wandb, use_amp=config.engine.use_amp, use_cuda_graph=config.engine.use_cuda_graph)
 
 if __name__ == '__main__':
     args = parse_args()